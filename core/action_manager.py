@@ -1,39 +1,47 @@
 from typing import Dict, List, Optional
 import logging
+import re
 from models import Message, BotConfig, Personality
 from utils.llm_cache import LLMCache
 
 logger = logging.getLogger(__name__)
 
+# Speaker name used for a context message that has no explicit name
+_DEFAULT_NAMES = {"assistant": "AI Teammate", "user": "User"}
+
 class ActionManager:
+    # Matches "Respond: <reason>" / "Don't respond: <reason>" decisions
+    _DECISION_RE = re.compile(r"\s*(respond|don't respond)\s*:\s*(.*)", re.IGNORECASE | re.DOTALL)
+    
     def __init__(self, config: BotConfig, personality: Optional[Personality] = None):
         self.config = config
         self.llm_cache = LLMCache(cache_dir="cache/decisions")
+        self.set_personality(personality)
+        
+    def set_personality(self, personality: Optional[Personality]):
+        """Store the personality and rebuild the cached system prompt"""
         self.personality = personality
+        personality_prompt = (personality.get_prompt_modifiers() + "\n\n") if personality else ""
+        self._system_prompt = personality_prompt + self.ACTION_PROMPT
         
     def should_respond(self, context: List[Dict], message: Message) -> bool:
         """Use LLM to decide whether to respond based on context and personality"""
         try:
             conversation = self._format_conversation(context)
             
-            # Add personality-specific prompt modifiers
-            personality_prompt = ""
-            if self.personality:
-                personality_prompt = self.personality.get_prompt_modifiers() + "\n\n"
-            
             messages = [
-                {"role": "system", "content": personality_prompt + self.ACTION_PROMPT},
+                {"role": "system", "content": self._system_prompt},
                 {"role": "user", "content": f"Current conversation:\n{conversation}\n\nLatest message: {message.content}"}
             ]
             
-            decision = self.llm_cache.generate_response(messages).strip().lower()
-            should_respond = decision.startswith('respond:')
+            decision = self.llm_cache.generate_response(messages)
+            match = self._DECISION_RE.match(decision)
+            should_respond = bool(match) and match.group(1).lower() == 'respond'
+            reason = match.group(2).strip() if match else decision.strip()
             
             if should_respond:
-                reason = decision[8:].strip()  # Extract reason after "respond:"
                 logger.info(f"Decided to respond because: {reason}")
             else:
-                reason = decision[12:].strip()  # Extract reason after "don't respond:"
                 logger.info(f"Decided not to respond because: {reason}")
             
             return should_respond
@@ -46,11 +54,12 @@ class ActionManager:
         """Format conversation context for the prompt"""
         formatted = []
         for msg in context:
-            if msg["role"] == "system":
-                formatted.append(f"Context: {msg['content']}")
+            role = msg["role"]
+            if role == "system":
+                formatted.append("Context: " + msg["content"])
             else:
-                name = msg.get("name", "AI Teammate" if msg["role"] == "assistant" else "User")
-                formatted.append(f"{name}: {msg['content']}")
+                name = msg.get("name") or _DEFAULT_NAMES.get(role, "User")
+                formatted.append(name + ": " + msg["content"])
         return "\n".join(formatted)
 
     ACTION_PROMPT = """You are the decision-making system for an AI teammate participating in a team conversation. Your role is to help the AI engage naturally in discussions, just as any other team member would.
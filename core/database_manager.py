@@ -1,23 +1,337 @@
-import os
 import sqlite3
 import logging
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterator
 from datetime import datetime
 from models import Message, BotConfig, LongTermMemory
 from core.personality import Personality
 import threading
-import json
+import weakref
+import queue
+import orjson
 from pathlib import Path
 import time
 import uuid
+from collections import deque
+from contextlib import closing, contextmanager
+from functools import lru_cache
+from concurrent.futures import Future
 
 logger = logging.getLogger(__name__)
 
+# Applied to every connection; journal_mode=WAL persists in the file and is set once at init
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Stored in PRAGMA user_version; bump whenever the tables or indexes below change
+SCHEMA_VERSION = 4
+
+def _dumps(value) -> str:
+    """Serialize a value to compact JSON for a TEXT column"""
+    return orjson.dumps(value).decode()
+
+# Buffered message/history rows are written at least this often (seconds)...
+FLUSH_INTERVAL = 0.2
+# ...or as soon as this many rows are waiting
+FLUSH_MAX_ROWS = 500
+
+# Wakes the writer thread without giving it a job
+_WAKE = ()
+
+# Idle read-only connections kept open for reuse
+READER_POOL_SIZE = 4
+
+# sqlite_db_name value that keeps the whole database in memory (tests, throwaway instances)
+IN_MEMORY_DB_NAME = ':memory:'
+
+# Statement text is kept identical across calls so each connection's statement
+# cache (cached_statements in _connect) reuses the compiled statement
+_SQL_INSERT_MESSAGE = (
+    "INSERT INTO messages (id, content, user_id, room_id, timestamp, type) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_SQL_INSERT_HISTORY = (
+    "INSERT INTO history (user_id, channel_name, content, ts, role) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+# Insert a new user or update the existing row in a single statement
+_SQL_UPSERT_USER = '''
+    INSERT INTO users (user_id, name, timestamp, room_id)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        name = excluded.name,
+        timestamp = excluded.timestamp,
+        room_id = excluded.room_id
+'''
+_SQL_SELECT_USER_NAME = "SELECT name FROM users WHERE user_id = ?"
+_SQL_INSERT_CONTEXT_HISTORY = '''
+    INSERT INTO context_history (
+        message_ts, channel_name, user_id, message_content,
+        context, response, response_type
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_LONG_TERM_MEMORY = '''
+    INSERT INTO long_term_memories (
+        channel_name, timestamp, summary, insights,
+        key_points, participants, conversation_start,
+        conversation_end
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_MEMORY_PARTICIPANT = (
+    "INSERT OR IGNORE INTO memory_participants (memory_id, user_id) VALUES (?, ?)"
+)
+_SQL_SELECT_MEMORY_IDS = "SELECT memory_id FROM memory_participants WHERE user_id = ?"
+_SQL_SELECT_RECENT_HISTORY = '''
+    SELECT user_id, channel_name, content, ts, role
+    FROM history
+    WHERE channel_name = ?
+    ORDER BY ts DESC
+    LIMIT ?
+'''
+# Pop the oldest message for a channel in one statement; deleting by id
+# avoids removing other rows that happen to share the same ts
+_SQL_POP_QUEUED_MESSAGE = '''
+    DELETE FROM new_msg_queue
+    WHERE id = (
+        SELECT id FROM new_msg_queue
+        WHERE channel_name = ?
+        ORDER BY ts ASC
+        LIMIT 1
+    )
+    RETURNING user_id, channel_name, content, ts, role
+'''
+# DELETE ... RETURNING needs SQLite 3.35; older libraries select the row, then delete it by id
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+_SQL_SELECT_QUEUED_MESSAGE = '''
+    SELECT id, user_id, channel_name, content, ts, role
+    FROM new_msg_queue
+    WHERE channel_name = ?
+    ORDER BY ts ASC
+    LIMIT 1
+'''
+# Insert, or update the existing persona in place; created_at is kept on update
+_SQL_UPSERT_PERSONA = '''
+    INSERT INTO personas (
+        channel_name, name, description, traits,
+        response_characteristics, communication_style,
+        created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(channel_name) DO UPDATE SET
+        name = excluded.name,
+        description = excluded.description,
+        traits = excluded.traits,
+        response_characteristics = excluded.response_characteristics,
+        communication_style = excluded.communication_style,
+        updated_at = excluded.updated_at
+'''
+_SQL_SELECT_PERSONA = '''
+    SELECT name, description, traits, response_characteristics, communication_style
+    FROM personas
+    WHERE channel_name = ?
+'''
+
+# Every table and index, applied as one script inside a single transaction
+_SCHEMA_SQL = f'''
+BEGIN IMMEDIATE;
+
+-- Create messages table with room_id column
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    content TEXT,
+    user_id TEXT,
+    room_id TEXT,
+    timestamp REAL,
+    type TEXT
+);
+
+-- Index room lookups together with the timestamp they're ordered by;
+-- this also covers plain room_id filters, so the old single-column index goes
+DROP INDEX IF EXISTS idx_messages_room_id;
+CREATE INDEX IF NOT EXISTS idx_messages_room_ts ON messages(room_id, timestamp);
+
+-- get_history filtered by room and user, still ordered by timestamp
+CREATE INDEX IF NOT EXISTS idx_messages_room_user_ts ON messages(room_id, user_id, timestamp);
+
+-- Create history table if it doesn't exist
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    channel_name TEXT,
+    content TEXT,
+    ts REAL,
+    role TEXT DEFAULT 'user'
+);
+
+-- Index channel and user lookups together with ts for ordered scans
+DROP INDEX IF EXISTS idx_history_channel_name;
+CREATE INDEX IF NOT EXISTS idx_history_chan_ts ON history(channel_name, ts);
+CREATE INDEX IF NOT EXISTS idx_history_user_ts ON history(user_id, ts);
+
+-- Create users table - add room_id field
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT,
+    room_id TEXT,
+    timestamp REAL
+);
+
+-- Create index on room_id for users table
+CREATE INDEX IF NOT EXISTS idx_users_room_id ON users(room_id);
+
+-- Create personas table if it doesn't exist - match table name with save_persona
+CREATE TABLE IF NOT EXISTS personas (
+    channel_name TEXT PRIMARY KEY,
+    name TEXT,
+    description TEXT,
+    traits TEXT,
+    response_characteristics TEXT,
+    communication_style TEXT,
+    created_at REAL,
+    updated_at REAL
+);
+
+-- Create message queue table if it doesn't exist
+CREATE TABLE IF NOT EXISTS new_msg_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    channel_name TEXT,
+    content TEXT,
+    ts REAL,
+    role TEXT DEFAULT 'user'
+);
+
+-- get_message_from_queue pops the oldest message per channel
+CREATE INDEX IF NOT EXISTS idx_queue_chan_ts ON new_msg_queue(channel_name, ts);
+
+-- Create long-term memories table if it doesn't exist
+CREATE TABLE IF NOT EXISTS long_term_memories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_name TEXT,
+    timestamp REAL,
+    summary TEXT,
+    insights TEXT,
+    key_points TEXT,
+    participants TEXT,
+    conversation_start REAL,
+    conversation_end REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ltm_chan_ts ON long_term_memories(channel_name, timestamp);
+
+-- One row per memory participant, so memories can be looked up by user
+CREATE TABLE IF NOT EXISTS memory_participants (
+    memory_id INTEGER,
+    user_id TEXT,
+    PRIMARY KEY (memory_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_mp_user ON memory_participants(user_id);
+
+-- Create context history table if it doesn't exist
+CREATE TABLE IF NOT EXISTS context_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_ts REAL,
+    channel_name TEXT,
+    user_id TEXT,
+    message_content TEXT,
+    context TEXT,
+    long_term_memory_id INTEGER,
+    response TEXT,
+    response_type TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ctx_chan_ts ON context_history(channel_name, message_ts);
+
+-- Archive tables for rows moved out by archive_history, keeping the live tables small
+CREATE TABLE IF NOT EXISTS history_archive (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT,
+    channel_name TEXT,
+    content TEXT,
+    ts REAL,
+    role TEXT DEFAULT 'user'
+);
+CREATE TABLE IF NOT EXISTS context_history_archive (
+    id INTEGER PRIMARY KEY,
+    message_ts REAL,
+    channel_name TEXT,
+    user_id TEXT,
+    message_content TEXT,
+    context TEXT,
+    long_term_memory_id INTEGER,
+    response TEXT,
+    response_type TEXT
+);
+
+-- Create room_tasks table if it doesn't exist
+CREATE TABLE IF NOT EXISTS room_tasks (
+    room_name TEXT PRIMARY KEY,
+    task TEXT,
+    timestamp REAL
+);
+
+-- Refresh planner statistics so the composite indexes above get picked
+ANALYZE;
+
+PRAGMA user_version = {SCHEMA_VERSION};
+COMMIT;
+'''
+
+@lru_cache(maxsize=32)
+def _history_query(has_room: bool, has_user: bool, has_start: bool, has_end: bool, has_limit: bool) -> str:
+    """Build the get_history SQL for one combination of filters; parameters follow in the same order"""
+    # Base query, with channel_name and ts returned as aliases for room_id and timestamp
+    query = (
+        "SELECT id, content, user_id, room_id, room_id AS channel_name, "
+        "timestamp, timestamp AS ts, type FROM messages WHERE 1=1"
+    )
+    if has_room:
+        query += " AND room_id = ?"
+    if has_user:
+        query += " AND user_id = ?"
+    if has_start:
+        query += " AND timestamp >= ?"
+    if has_end:
+        query += " AND timestamp <= ?"
+    query += " ORDER BY timestamp DESC"
+    if has_limit:
+        query += " LIMIT ?"
+    return query
+
 class DatabaseManager:
     def __init__(self, config: BotConfig):
         self.config = config
-        self.lock = threading.Lock()
+        # Resolved once; every connection reuses it
+        self._db_path = self._get_db_path()
+        # Idle read-only connections; SimpleQueue needs no extra lock for get/put
+        self._read_pool = queue.SimpleQueue()
+        # Named shared-cache URI for in-memory databases, so every connection sees the same data
+        self._memory_uri = None
+        if self._db_path.name == IN_MEMORY_DB_NAME:
+            self._memory_uri = f"file:chat-{id(self)}?mode=memory&cache=shared"
         self._init_databases()
+        if not self._memory_uri:
+            for _ in range(READER_POOL_SIZE):
+                self._read_pool.put(self._open_reader())
+        
+        # Message and history inserts are buffered and written in batches by the writer
+        # thread, so a crash can lose at most FLUSH_INTERVAL worth of chat history
+        self._msg_buf = deque()
+        self._history_buf = deque()
+        
+        # Every write runs on one writer thread that owns the writer connection, so
+        # callers queue work instead of contending for a lock around the connection
+        self._write_queue = queue.SimpleQueue()
+        self._writer_thread = threading.Thread(
+            target=self._write_loop,
+            args=(self._write_queue, self._writer, self._msg_buf, self._history_buf),
+            name='db-writer', daemon=True)
+        self._writer_thread.start()
+        # The writer thread gets only the state it needs, not self, so an unreferenced
+        # manager is still collected; the finalizer then stops the writer, and also runs at exit
+        self._finalizer = weakref.finalize(self, self._stop_writer, self._write_queue, self._writer_thread)
         
     def _init_databases(self):
         """Initialize all required databases and tables"""
@@ -25,434 +339,462 @@ class DatabaseManager:
             self._init_sqlite()
             logger.info("Successfully initialized all databases")
         except Exception as e:
-            logger.error(f"Error initializing databases: {str(e)}")
+            logger.error("Error initializing databases: %s", e)
             raise
         
     def _init_sqlite(self):
         """Initialize SQLite database and create required tables"""
-        try:
-            # Create data directory if it doesn't exist
-            data_dir = Path("data")
-            data_dir.mkdir(exist_ok=True)
-            
-            # Get database name from config, handling both WebBotConfig and BotConfig
-            if hasattr(self.config, 'sqlite_db_name'):
-                db_name = self.config.sqlite_db_name
-            else:
-                db_name = getattr(self.config, 'sqDB_NAME', 'chat_history.db')
-            
-            # Use the full path for SQLite database
-            db_path = data_dir / db_name
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
-            
-            # Initialize tables using the _initialize_tables method
-            self._initialize_tables()
-            
-            logger.info(f"Successfully initialized SQLite database at {db_path}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error initializing SQLite database: {str(e)}")
-            return False
+        db_path = self._db_path
+        
+        # Create the database's directory (data/ or a subfolder of it) if it doesn't exist
+        if not self._memory_uri:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # A single long-lived connection handles every write, used only by the writer thread.
+        # It's opened before the tables so an in-memory database exists from here on
+        self._writer = self._connect(isolation_level='IMMEDIATE', check_same_thread=False)
+        
+        # Initialize tables using the _initialize_tables method
+        self._initialize_tables()
+        
+        logger.info("Successfully initialized SQLite database at %s", db_path)
     
     def _get_db_path(self) -> Path:
         """Get the database path handling both config types"""
-        data_dir = Path("data")
-        if hasattr(self.config, 'sqlite_db_name'):
-            db_name = self.config.sqlite_db_name
-        else:
-            db_name = getattr(self.config, 'sqDB_NAME', 'chat_history.db')
-        return data_dir / db_name
+        db_name = getattr(self.config, 'sqlite_db_name', None) or getattr(self.config, 'sqDB_NAME', 'chat_history.db')
+        return Path("data") / db_name
+
+    def _connect(self, database=None, **kwargs) -> sqlite3.Connection:
+        """Open a connection to the database with the performance pragmas applied"""
+        # timeout also sets SQLite's busy timeout, so writers wait instead of failing,
+        # and cached_statements keeps the hot SQL compiled on these long-lived connections
+        if database is None:
+            if self._memory_uri:
+                database = self._memory_uri
+                kwargs['uri'] = True
+            else:
+                database = self._db_path
+        conn = sqlite3.connect(database, timeout=30.0, cached_statements=256, **kwargs)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # Rows map column names to values in C, so dict(row) replaces hand-built dicts
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _open_reader(self) -> sqlite3.Connection:
+        """Open a read-only connection that any thread may borrow"""
+        uri = self._db_path.resolve().as_uri() + '?mode=ro'
+        return self._connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def _reader(self):
+        """Borrow a read-only connection from the pool, opening one if none are idle"""
+        # Shared-cache readers would hit table locks while the writer is busy,
+        # so in-memory databases just read through the writer connection
+        if self._memory_uri:
+            yield self._writer
+            return
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_reader()
+        try:
+            yield conn
+        finally:
+            # Return it for reuse unless enough idle connections are already pooled
+            if self._read_pool.qsize() < READER_POOL_SIZE:
+                self._read_pool.put(conn)
+            else:
+                conn.close()
+
+    def close(self) -> None:
+        """Flush buffered rows, stop the writer thread and close pooled reader connections"""
+        self._finalizer()
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
+
+    def _write(self, job):
+        """Run job(conn) on the writer thread and return its result"""
+        if not self._writer_thread.is_alive():
+            raise sqlite3.ProgrammingError("DatabaseManager is closed")
+        future = Future()
+        self._write_queue.put((job, future))
+        return future.result()
+
+    def _submit(self, job) -> None:
+        """Queue job(conn) for the writer thread without waiting for it; failures are logged"""
+        if not self._writer_thread.is_alive():
+            raise sqlite3.ProgrammingError("DatabaseManager is closed")
+        self._write_queue.put((job, None))
+
+    @staticmethod
+    def _stop_writer(write_queue: queue.SimpleQueue, writer_thread: threading.Thread) -> None:
+        """Have the writer commit what's buffered, close its connection and exit"""
+        if writer_thread.is_alive():
+            write_queue.put(None)
+            # A manager collected on the writer thread itself can't wait for it
+            if writer_thread is not threading.current_thread():
+                writer_thread.join()
+
+    @staticmethod
+    def _write_loop(write_queue: queue.SimpleQueue, writer: sqlite3.Connection,
+                    msg_buf: deque, history_buf: deque) -> None:
+        """Writer thread: commit buffered rows and every queued job in one transaction per batch"""
+        stopping = False
+        while not stopping:
+            try:
+                items = [write_queue.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                items = []
+            # Take whatever else is already waiting so it shares the commit
+            while True:
+                try:
+                    items.append(write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in items:
+                stopping = True
+            jobs = [item for item in items if item]
+            if not jobs and not msg_buf and not history_buf:
+                continue
+            
+            done = []
+            try:
+                with writer as conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    # Buffered rows go first, so a job queued after them (e.g. a reader's
+                    # flush) only completes once they're committed
+                    DatabaseManager._write_buffered(conn, msg_buf, history_buf)
+                    for job, future in jobs:
+                        done.append((future, *DatabaseManager._run_job(conn, job)))
+            except Exception as e:
+                logger.error("Error committing write batch: %s", e)
+                for _, future in jobs:
+                    if future:
+                        future.set_exception(e)
+                continue
+            
+            for future, result, error in done:
+                if future is None:
+                    if error:
+                        logger.error("Error in queued write: %s", error)
+                elif error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        
+        writer.close()
+
+    @staticmethod
+    def _run_job(conn: sqlite3.Connection, job) -> tuple:
+        """Run one job inside a savepoint so its failure doesn't undo the rest of the batch"""
+        conn.execute('SAVEPOINT job')
+        try:
+            result = job(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK TO job')
+            conn.execute('RELEASE job')
+            return None, e
+        conn.execute('RELEASE job')
+        return result, None
+
+    def _buffer_rows(self, message_row: Optional[tuple], history_row: tuple) -> None:
+        """Queue rows for the writer thread, waking it early if the buffer is full"""
+        # Nothing would ever write rows buffered after close()
+        if not self._writer_thread.is_alive():
+            raise sqlite3.ProgrammingError("DatabaseManager is closed")
+        if message_row:
+            self._msg_buf.append(message_row)
+        self._history_buf.append(history_row)
+        if len(self._msg_buf) + len(self._history_buf) >= FLUSH_MAX_ROWS:
+            self._write_queue.put(_WAKE)
+
+    @staticmethod
+    def _write_buffered(conn: sqlite3.Connection, msg_buf: deque, history_buf: deque) -> None:
+        """Insert all buffered message and history rows on the writer connection"""
+        message_rows = [msg_buf.popleft() for _ in range(len(msg_buf))]
+        history_rows = [history_buf.popleft() for _ in range(len(history_buf))]
+        DatabaseManager._insert_buffered(conn, _SQL_INSERT_MESSAGE, message_rows)
+        DatabaseManager._insert_buffered(conn, _SQL_INSERT_HISTORY, history_rows)
+
+    @staticmethod
+    def _insert_buffered(conn: sqlite3.Connection, sql: str, rows: List[tuple]) -> None:
+        """Insert buffered rows in their own savepoint so a bad row can't fail the jobs in the batch"""
+        if not rows:
+            return
+        conn.execute('SAVEPOINT buffered')
+        try:
+            conn.executemany(sql, rows)
+        except sqlite3.Error as e:
+            conn.execute('ROLLBACK TO buffered')
+            logger.error("Error in buffered insert, retrying rows one at a time: %s", e)
+            # A failing statement only undoes itself, so the good rows still go in
+            for row in rows:
+                try:
+                    conn.execute(sql, row)
+                except sqlite3.Error as row_error:
+                    logger.error("Dropping buffered row %s: %s", row[0], row_error)
+        conn.execute('RELEASE buffered')
+
+    def flush(self) -> None:
+        """Wait until every buffered message and history row is committed"""
+        self._write(lambda conn: None)
 
     def save_user(self, user_id: str, name: str, timestamp: float, room_id: str) -> None:
         """Save or update user information"""
-        with self.lock:
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            try:
-                # Try to update existing user
-                cursor.execute('''
-                    UPDATE users 
-                    SET name = ?, timestamp = ?, room_id = ?
-                    WHERE user_id = ?
-                ''', (name, timestamp, room_id, user_id))
-                
-                # If no user was updated, insert new user
-                if cursor.rowcount == 0:
-                    cursor.execute('''
-                        INSERT INTO users (user_id, name, timestamp, room_id)
-                        VALUES (?, ?, ?, ?)
-                    ''', (user_id, name, timestamp, room_id))
-                
-                conn.commit()
-                logger.info(f"Saved user information for {name} ({user_id})")
-                
-            finally:
-                cursor.close()
-                conn.close()
+        self._write(lambda conn: conn.execute(_SQL_UPSERT_USER, (user_id, name, timestamp, room_id)))
+        logger.info("Saved user information for %s (%s)", name, user_id)
                 
     def get_user_name(self, user_id: str) -> Optional[str]:
         """Get user's name from database"""
-        db_path = self._get_db_path()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('SELECT name FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-            
-        finally:
-            cursor.close()
-            conn.close()
+        with self._reader() as conn:
+            result = conn.execute(_SQL_SELECT_USER_NAME, (user_id,)).fetchone()
+        return result[0] if result else None
+
+    def get_user_names(self, user_ids) -> Dict[str, str]:
+        """Get the names of several users in one query, keyed by user_id"""
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return {}
+        placeholders = ','.join('?' * len(user_ids))
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"SELECT user_id, name FROM users WHERE user_id IN ({placeholders})", user_ids
+            ).fetchall()
+        return {row['user_id']: row['name'] for row in rows}
     
     def save_message(self, message: Message) -> None:
-        """Save a message to the database with room_id"""
+        """Queue a message, and its history entry, to be saved with room_id"""
         try:
-            # Get a fresh connection to the database with timeout
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
-            cursor = conn.cursor()
+            # Generate an ID only if not present; a getattr default would build one every call
+            message_id = getattr(message, 'id', None) or uuid.uuid4().hex
+            
+            # Extract channel_name from message
+            channel_name = message.channel_name
+            
+            self._buffer_rows(
+                # messages row, using channel_name as room_id and ts as timestamp
+                (message_id, message.content, message.user_id, channel_name, message.ts, message.type),
+                # history row
+                (message.user_id, channel_name, message.content, message.ts, getattr(message, 'role', 'user'))
+            )
+            
+            logger.info("Queued message %s for room %s", message_id, channel_name)
             
-            try:
-                # Begin immediate transaction to acquire a write lock
-                cursor.execute('BEGIN IMMEDIATE')
-                
-                # Generate an ID if not present
-                message_id = getattr(message, 'id', str(uuid.uuid4()))
-                
-                # Extract channel_name from message
-                channel_name = message.channel_name
-                
-                # Insert into messages table with room_id
-                cursor.execute(
-                    "INSERT INTO messages (id, content, user_id, room_id, timestamp, type) "
-                    "VALUES (?, ?, ?, ?, ?, ?)",
-                    (
-                        message_id,
-                        message.content,
-                        message.user_id,
-                        channel_name,  # Use channel_name as room_id
-                        message.ts,  # Use ts as timestamp
-                        message.type
-                    )
-                )
-                
-                # Commit the transaction
-                cursor.execute('COMMIT')
-                
-                logger.info(f"Saved message {message_id} to database for room {channel_name}")
-                
-                # Also save to history table with field names matching what save_to_history expects
-                # This is done in a separate transaction to avoid holding locks too long
-                history_data = {
-                    'id': message_id,
-                    'content': message.content,
-                    'user_id': message.user_id,
-                    'room_id': channel_name,
-                    'channel_name': channel_name,  # Required by save_to_history
-                    'ts': message.ts,  # Required by save_to_history (not 'timestamp')
-                    'type': message.type,
-                    'role': getattr(message, 'role', 'user')  # Required by save_to_history
-                }
-                
-                # Save to history in a separate try block to avoid dependency
-                self.save_to_history(history_data)
-                
-            except Exception as e:
-                # Rollback if there's an error
-                try:
-                    cursor.execute('ROLLBACK')
-                except:
-                    pass
-                logger.error(f"Error saving message to database: {str(e)}")
-                raise
-            finally:
-                cursor.close()
-                conn.close()
         except Exception as e:
-            logger.error(f"Error in save_message: {str(e)}")
+            logger.error("Error in save_message: %s", e)
             # Don't re-raise to allow the application to continue
             
     def save_to_history(self, message_dict: Dict) -> None:
-        """Save message to history"""
-        # Use a local lock instead of self.lock to prevent deadlocks
+        """Queue a message to be saved to history"""
+        self._buffer_rows(None, (
+            message_dict['user_id'],
+            message_dict['channel_name'],
+            message_dict['content'],
+            message_dict['ts'],
+            message_dict.get('role', 'user')
+        ))
+                
+    def save_messages_bulk(self, messages: List[Message]) -> None:
+        """Save several messages, and their history rows, in a single transaction"""
+        if not messages:
+            return
         try:
-            db_path = self._get_db_path()
-            # Add timeout and isolation_level parameters to prevent locking
-            conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
-            cursor = conn.cursor()
+            message_rows = [
+                (getattr(m, 'id', None) or uuid.uuid4().hex, m.content, m.user_id, m.channel_name, m.ts, m.type)
+                for m in messages
+            ]
+            history_rows = [
+                (m.user_id, m.channel_name, m.content, m.ts, getattr(m, 'role', 'user'))
+                for m in messages
+            ]
+            
+            # One commit for the whole batch instead of two per message
+            def insert_batch(conn):
+                conn.executemany(_SQL_INSERT_MESSAGE, message_rows)
+                conn.executemany(_SQL_INSERT_HISTORY, history_rows)
+            self._write(insert_batch)
+            
+            logger.info("Saved %s messages to database", len(message_rows))
             
-            try:
-                # Begin immediate transaction to acquire a write lock
-                cursor.execute('BEGIN IMMEDIATE')
-                
-                cursor.execute('''
-                    INSERT INTO history (user_id, channel_name, content, ts, role)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    message_dict['user_id'],
-                    message_dict['channel_name'],
-                    message_dict['content'],
-                    message_dict['ts'],
-                    message_dict.get('role', 'user')
-                ))
-                
-                # Explicitly commit the transaction
-                cursor.execute('COMMIT')
-                
-            except Exception as e:
-                # Rollback if there's an error
-                try:
-                    cursor.execute('ROLLBACK')
-                except:
-                    pass
-                logger.error(f"Error saving to history: {str(e)}")
-                raise
-            finally:
-                cursor.close()
-                conn.close()
         except Exception as e:
-            logger.error(f"Error in save_to_history: {str(e)}")
+            logger.error("Error in save_messages_bulk: %s", e)
+            # Don't re-raise to allow the application to continue
+            
+    def save_history_bulk(self, message_dicts: List[Dict]) -> None:
+        """Save several history entries in a single transaction"""
+        if not message_dicts:
+            return
+        try:
+            rows = [
+                (d['user_id'], d['channel_name'], d['content'], d['ts'], d.get('role', 'user'))
+                for d in message_dicts
+            ]
+            self._write(lambda conn: conn.executemany(_SQL_INSERT_HISTORY, rows))
+        except Exception as e:
+            logger.error("Error in save_history_bulk: %s", e)
             # Re-raise the exception to let the caller handle it
             raise
                 
     def save_context_history(self, message: Message, context: List[Dict], response: Optional[str], response_type: str) -> None:
         """Save context history"""
-        with self.lock:
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute('''
-                    INSERT INTO context_history (
-                        message_ts, channel_name, user_id, message_content,
-                        context, response, response_type
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    message.ts,
-                    message.channel_name,
-                    message.user_id,
-                    message.content,
-                    json.dumps(context),
-                    response,
-                    response_type
-                ))
-                conn.commit()
-            finally:
-                cursor.close()
-                conn.close()
+        # Serialize here so the writer thread only has to run the insert; callers
+        # don't need the row back, so they don't wait for the commit either
+        context_json = _dumps(context)
+        self._submit(lambda conn: conn.execute(_SQL_INSERT_CONTEXT_HISTORY, (
+            message.ts,
+            message.channel_name,
+            message.user_id,
+            message.content,
+            context_json,
+            response,
+            response_type
+        )))
                 
     def save_long_term_memory(self, memory: LongTermMemory, channel_name: str, conversation_start: float, conversation_end: float) -> int:
         """Save long-term memory and return its ID"""
-        with self.lock:
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute('''
-                    INSERT INTO long_term_memories (
-                        channel_name, timestamp, summary, insights,
-                        key_points, participants, conversation_start,
-                        conversation_end
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    channel_name,
-                    memory.timestamp,
-                    memory.summary,
-                    json.dumps(memory.insights),
-                    json.dumps(memory.key_points),
-                    json.dumps(memory.participants),
-                    conversation_start,
-                    conversation_end
-                ))
-                conn.commit()
-                return cursor.lastrowid
-            finally:
-                cursor.close()
-                conn.close()
+        insights = _dumps(memory.insights)
+        key_points = _dumps(memory.key_points)
+        # The JSON copy stays on the memory row for readers that load it whole
+        participants = _dumps(memory.participants)
+        
+        def insert(conn):
+            memory_id = conn.execute(_SQL_INSERT_LONG_TERM_MEMORY, (
+                channel_name,
+                memory.timestamp,
+                memory.summary,
+                insights,
+                key_points,
+                participants,
+                conversation_start,
+                conversation_end
+            )).lastrowid
+            conn.executemany(
+                _SQL_INSERT_MEMORY_PARTICIPANT,
+                [(memory_id, user_id) for user_id in memory.participants]
+            )
+            return memory_id
+        
+        return self._write(insert)
+
+    def get_memory_ids_for_participant(self, user_id: str) -> List[int]:
+        """Get the IDs of long-term memories the user took part in"""
+        with self._reader() as conn:
+            rows = conn.execute(_SQL_SELECT_MEMORY_IDS, (user_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def archive_history(self, before_ts: float) -> int:
+        """Move history and context history older than before_ts into the archive tables"""
+        # Flush first so buffered rows older than the cutoff are archived with the rest
+        self.flush()
+        
+        def archive(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO history_archive SELECT * FROM history WHERE ts < ?", (before_ts,)
+            )
+            moved = conn.execute("DELETE FROM history WHERE ts < ?", (before_ts,)).rowcount
+            conn.execute(
+                "INSERT OR IGNORE INTO context_history_archive SELECT * FROM context_history WHERE message_ts < ?",
+                (before_ts,)
+            )
+            moved += conn.execute("DELETE FROM context_history WHERE message_ts < ?", (before_ts,)).rowcount
+            return moved
+        
+        moved = self._write(archive)
+        logger.info("Archived %s history rows older than %s", moved, before_ts)
+        return moved
 
     def get_message_from_queue(self, channel_name: str) -> Optional[Dict]:
         """Get and remove message from queue"""
-        db_path = self._get_db_path()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        if _HAS_RETURNING:
+            row = self._write(lambda conn: conn.execute(_SQL_POP_QUEUED_MESSAGE, (channel_name,)).fetchone())
+            return dict(row) if row else None
         
-        try:
-            # Get the oldest message for the channel
-            cursor.execute('''
-                SELECT user_id, channel_name, content, ts, role
-                FROM new_msg_queue
-                WHERE channel_name = ?
-                ORDER BY ts ASC
-                LIMIT 1
-            ''', (channel_name,))
-            
-            row = cursor.fetchone()
-            if not row:
-                return None
-            
-            # Delete the retrieved message
-            cursor.execute('''
-                DELETE FROM new_msg_queue
-                WHERE channel_name = ? AND ts = ?
-            ''', (channel_name, row[3]))
-            
-            conn.commit()
-            
-            return {
-                'user_id': row[0],
-                'channel_name': row[1],
-                'content': row[2],
-                'ts': row[3],
-                'role': row[4]
-            }
-            
-        finally:
-            cursor.close()
-            conn.close()
+        def pop(conn):
+            # Both statements run in the same writer transaction, so nothing can take the row in between
+            row = conn.execute(_SQL_SELECT_QUEUED_MESSAGE, (channel_name,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM new_msg_queue WHERE id = ?", (row['id'],))
+            return row
+        
+        row = self._write(pop)
+        if not row:
+            return None
+        message = dict(row)
+        del message['id']
+        return message
+
+    def iter_history(self, options: Dict) -> Iterator[Dict]:
+        """Yield message history rows, newest first, with room_id filtering"""
+        # Make sure recently queued messages are visible
+        self.flush()
+        
+        # channel_name is an alternative to room_id
+        room = options.get('room_id') or options.get('channel_name')
+        filters = (room, options.get('user_id'), options.get('start_time'),
+                   options.get('end_time'), options.get('limit'))
+        query = _history_query(*(bool(value) for value in filters))
+        params = [value for value in filters if value]
+        
+        # The reader connection stays borrowed until the caller finishes or drops the iterator
+        with self._reader() as conn:
+            for row in conn.execute(query, params):
+                yield dict(row)
 
     def get_history(self, options: Dict) -> List[Dict]:
         """Get message history with room_id filtering"""
         try:
-            # Get a fresh connection to the database with timeout
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            try:
-                # Base query
-                query = "SELECT * FROM messages WHERE 1=1"
-                params = []
-                
-                # Filter by room_id if provided
-                if options.get('room_id'):
-                    query += " AND room_id = ?"
-                    params.append(options['room_id'])
-                
-                # Filter by channel_name if provided (alternative to room_id)
-                elif options.get('channel_name'):
-                    query += " AND room_id = ?"
-                    params.append(options['channel_name'])
-                    
-                # Filter by user_id if provided
-                if options.get('user_id'):
-                    query += " AND user_id = ?"
-                    params.append(options['user_id'])
-                
-                # Add timestamp constraints if provided
-                if options.get('start_time'):
-                    query += " AND timestamp >= ?"
-                    params.append(options['start_time'])
-                
-                if options.get('end_time'):
-                    query += " AND timestamp <= ?"
-                    params.append(options['end_time'])
-                
-                # Add limit if provided
-                if options.get('limit'):
-                    query += " ORDER BY timestamp DESC LIMIT ?"
-                    params.append(options['limit'])
-                else:
-                    query += " ORDER BY timestamp DESC"
-                
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
-                
-                # Convert to list of dictionaries
-                messages = []
-                for row in rows:
-                    messages.append({
-                        'id': row[0],
-                        'content': row[1],
-                        'user_id': row[2],
-                        'room_id': row[3],
-                        'channel_name': row[3],  # Add channel_name as alias for room_id
-                        'timestamp': row[4],
-                        'ts': row[4],  # Add ts as alias for timestamp
-                        'type': row[5]
-                    })
-                    
-                return messages
-            finally:
-                cursor.close()
-                conn.close()
+            return list(self.iter_history(options))
         except Exception as e:
-            logger.error(f"Error retrieving message history: {str(e)}")
+            logger.error("Error retrieving message history: %s", e)
             return []
 
+    def get_recent_history(self, channel_name: str, limit: int) -> List[Dict]:
+        """Get the latest history entries for a channel, newest first"""
+        # Write out any buffered history rows so they're included
+        self.flush()
+        with self._reader() as conn:
+            return [dict(row) for row in conn.execute(_SQL_SELECT_RECENT_HISTORY, (channel_name, limit))]
+
     def save_persona(self, channel_name: str, personality: Personality) -> bool:
         """Save or update a persona for a channel"""
-        with self.lock:
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
+        try:
+            current_time = time.time()
+            
+            # Convert personality to dictionary format and then to JSON
+            personality_dict = personality.to_dict()
+            traits = _dumps(personality_dict["traits"])
+            response_characteristics = _dumps(personality_dict["response_characteristics"])
+            communication_style = personality.communication_style or "standard"
+            
+            # Insert, or update the existing persona in place
+            self._write(lambda conn: conn.execute(_SQL_UPSERT_PERSONA, (
+                channel_name, personality.name, personality.description,
+                traits, response_characteristics, communication_style,
+                current_time, current_time
+            )))
+            
+            logger.info("Saved persona for channel %s", channel_name)
+            return True
             
-            try:
-                current_time = time.time()
-                
-                # Convert personality to dictionary format and then to JSON
-                personality_dict = personality.to_dict()
-                traits = json.dumps(personality_dict["traits"])
-                response_characteristics = json.dumps(personality_dict["response_characteristics"])
-                communication_style = personality_dict.get("communication_style", "standard") 
-                
-                # Try to update existing persona
-                cursor.execute("""
-                    INSERT OR REPLACE INTO personas (
-                        channel_name, name, description, traits, 
-                        response_characteristics, communication_style,
-                        created_at, updated_at
-                    ) VALUES (
-                        ?, ?, ?, ?, ?, ?, 
-                        COALESCE((SELECT created_at FROM personas WHERE channel_name = ?), ?),
-                        ?
-                    )
-                """, (
-                    channel_name, personality.name, personality.description,
-                    traits, response_characteristics, communication_style,
-                    channel_name, current_time, current_time
-                ))
-                
-                conn.commit()
-                logger.info(f"Saved persona for channel {channel_name}")
-                return True
-                
-            except Exception as e:
-                logger.error(f"Error saving persona: {str(e)}")
-                return False
-            finally:
-                cursor.close()
-                conn.close()
+        except Exception as e:
+            logger.error("Error saving persona: %s", e)
+            return False
 
     def load_persona(self, channel_name: str) -> Optional[Personality]:
         """Load a persona for a channel"""
-        db_path = self._get_db_path()
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
-                SELECT name, description, traits, response_characteristics, communication_style
-                FROM personas
-                WHERE channel_name = ?
-            """, (channel_name,))
+            with self._reader() as conn:
+                row = conn.execute(_SQL_SELECT_PERSONA, (channel_name,)).fetchone()
             
-            row = cursor.fetchone()
             if not row:
                 return None
             
             name, description, traits_json, resp_char_json, communication_style = row
             
             # Parse JSON strings back to dictionaries
-            traits = json.loads(traits_json)
-            response_characteristics = json.loads(resp_char_json)
+            traits = orjson.loads(traits_json)
+            response_characteristics = orjson.loads(resp_char_json)
             
             # Create personality dictionary and convert to Personality object
             personality_dict = {
@@ -466,162 +808,55 @@ class DatabaseManager:
             return Personality.from_dict(personality_dict)
             
         except Exception as e:
-            logger.error(f"Error loading persona: {str(e)}")
+            logger.error("Error loading persona: %s", e)
             return None
-        finally:
-            cursor.close()
-            conn.close()
 
     def save_task(self, room_name: str, task: str) -> None:
         """Save task for a room"""
         try:
-            self.db.execute(
-                "INSERT OR REPLACE INTO room_tasks (room_name, task) VALUES (?, ?)",
-                (room_name, task)
-            )
-            self.db.commit()
+            self._write(lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO room_tasks (room_name, task, timestamp) VALUES (?, ?, ?)",
+                (room_name, task, time.time())
+            ))
         except Exception as e:
-            logger.error(f"Error saving task: {str(e)}", exc_info=True)
+            logger.error("Error saving task: %s", e)
 
     def load_task(self, room_name: str) -> Optional[str]:
         """Load task for a room"""
         try:
-            result = self.db.execute(
-                "SELECT task FROM room_tasks WHERE room_name = ?",
-                (room_name,)
-            ).fetchone()
+            with self._reader() as conn:
+                result = conn.execute(
+                    "SELECT task FROM room_tasks WHERE room_name = ?",
+                    (room_name,)
+                ).fetchone()
             return result[0] if result else None
         except Exception as e:
-            logger.error(f"Error loading task: {str(e)}", exc_info=True)
+            logger.error("Error loading task: %s", e)
             return None
 
     def _initialize_tables(self):
         """Initialize database tables"""
-        try:
-            db_path = self._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Create messages table with room_id column
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id TEXT PRIMARY KEY,
-                content TEXT,
-                user_id TEXT,
-                room_id TEXT,
-                timestamp REAL,
-                type TEXT
-            )
-            ''')
-            
-            # Create index on room_id for faster queries
-            cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_messages_room_id ON messages(room_id)
-            ''')
-            
-            # Create history table if it doesn't exist
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                channel_name TEXT,
-                content TEXT,
-                ts REAL,
-                role TEXT DEFAULT 'user'
-            )
-            ''')
-            
-            # Create index on channel_name for faster queries
-            cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_history_channel_name ON history(channel_name)
-            ''')
-            
-            # Create users table - add room_id field
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                name TEXT,
-                room_id TEXT,
-                timestamp REAL
-            )
-            ''')
-            
-            # Create index on room_id for users table
-            cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_users_room_id ON users(room_id)
-            ''')
-            
-            # Create personas table if it doesn't exist - match table name with save_persona
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS personas (
-                channel_name TEXT PRIMARY KEY,
-                name TEXT,
-                description TEXT,
-                traits TEXT,
-                response_characteristics TEXT,
-                communication_style TEXT,
-                created_at REAL,
-                updated_at REAL
-            )
-            ''')
-            
-            # Create message queue table if it doesn't exist
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS new_msg_queue (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                channel_name TEXT,
-                content TEXT,
-                ts REAL,
-                role TEXT DEFAULT 'user'
-            )
-            ''')
-            
-            # Create long-term memories table if it doesn't exist
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS long_term_memories (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_name TEXT,
-                timestamp REAL,
-                summary TEXT,
-                insights TEXT,
-                key_points TEXT,
-                participants TEXT,
-                conversation_start REAL,
-                conversation_end REAL
-            )
-            ''')
-            
-            # Create context history table if it doesn't exist
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS context_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_ts REAL,
-                channel_name TEXT,
-                user_id TEXT,
-                message_content TEXT,
-                context TEXT,
-                long_term_memory_id INTEGER,
-                response TEXT,
-                response_type TEXT
-            )
-            ''')
-            
-            # Create room_tasks table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS room_tasks (
-                    room_name TEXT PRIMARY KEY,
-                task TEXT,
-                timestamp REAL
-                )
-            ''')
-            
-            conn.commit()
-            logger.info("Database tables initialized successfully")
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"Error initializing database tables: {str(e)}")
-            raise
-        finally:
-            cursor.close()
-            conn.close()
\ No newline at end of file
+        # Autocommit mode so the schema script controls its own transaction
+        with closing(self._connect(isolation_level=None)) as conn:
+            try:
+                # Nothing to do if the file already has the current schema
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                    logger.info("Database tables are up to date")
+                    return
+                
+                # Larger pages keep the B-trees shallower for the JSON-heavy columns; this only
+                # takes effect on a new, empty database, before WAL is switched on
+                conn.execute('PRAGMA page_size=8192')
+                
+                # WAL lets readers run alongside a writer and avoids an fsync per commit;
+                # it can't be switched inside a transaction
+                conn.execute('PRAGMA journal_mode=WAL')
+                
+                # The script runs its own BEGIN IMMEDIATE ... COMMIT
+                conn.executescript(_SCHEMA_SQL)
+                logger.info("Database tables initialized successfully")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                logger.error("Error initializing database tables: %s", e)
+                raise
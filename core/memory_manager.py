@@ -1,18 +1,19 @@
 from typing import List, Dict, Optional
 import logging
-import json
+import orjson
 import time
+from collections import deque
 from models import Message, BotConfig, LongTermMemory, ConversationMemory
 from utils.llm_cache import LLMCache
 from core.database_manager import DatabaseManager
-import sqlite3
 
 logger = logging.getLogger(__name__)
 
 class MemoryManager:
-    def __init__(self, config: BotConfig):
+    def __init__(self, config: BotConfig, db_manager: Optional[DatabaseManager] = None):
         self.config = config
-        self.db_manager = DatabaseManager(config)
+        # Borrow the caller's database manager rather than opening a second one
+        self.db_manager = db_manager or DatabaseManager(config)
         self.conversations = {}
         self.short_term_limit = 10  # Keep last 10 messages
         self.memory_threshold = 5   # Generate long-term memory every 5 messages
@@ -38,16 +39,13 @@ class MemoryManager:
             "ts": message.ts,
             "name": user_profile_dict.get(message.user_id, message.user_id)
         }
+        # The deque drops the oldest message once short_term_limit is reached
         conv_memory["messages"].append(msg_dict)
         
-        # Trim short-term memory if needed
-        if len(conv_memory["messages"]) > self.short_term_limit:
-            conv_memory["messages"] = conv_memory["messages"][-self.short_term_limit:]
-        
         # Generate long-term memory if threshold reached and we have messages
         if len(conv_memory["messages"]) >= self.memory_threshold:
             if self._generate_long_term_memory(conv_memory):
-                conv_memory["messages"] = []  # Only clear if memory was generated successfully
+                conv_memory["messages"].clear()  # Only clear if memory was generated successfully
     
     def _load_conversation(self, channel_name: str) -> Dict:
         """Load conversation history from the database
@@ -81,39 +79,32 @@ class MemoryManager:
                     
                     # Convert messages to the required format and add to conversation
                     for msg in history_messages:
-                        # Get username if available
-                        user_name = self.db_manager.get_user_name(msg['user_id']) or msg['user_id']
-                        
-                        # Add to messages list
                         conversation["messages"].append({
                             "role": msg.get('role', 'user'),
                             "content": msg['content'],
                             "user_id": msg['user_id'],
-                            "ts": msg['ts'],
-                            "name": user_name
+                            "ts": msg['ts']
                         })
             except Exception as history_error:
                 logger.error(f"Error loading from history table: {str(history_error)}")
             
             # If we didn't get any messages from history, try the messages table
             if not conversation["messages"]:
-                messages = self.db_manager.get_history(options)
-                
-                # Convert messages to the required format
-                for msg in messages:
-                    # Get username if available
-                    user_name = self.db_manager.get_user_name(msg['user_id']) or msg['user_id']
-                    
-                    # Add to messages list
+                # Convert messages to the required format as they're read
+                for msg in self.db_manager.iter_history(options):
                     conversation["messages"].append({
                         "role": msg.get('role', 'user'),
                         "content": msg['content'],
                         "user_id": msg['user_id'],
-                        "ts": msg['ts'],
-                        "name": user_name
+                        "ts": msg['ts']
                     })
                 
-                logger.info(f"Loaded {len(messages)} messages from messages table for channel {channel_name}")
+                logger.info(f"Loaded {len(conversation['messages'])} messages from messages table for channel {channel_name}")
+            
+            # Look up every sender's name in one query, falling back to the user_id
+            user_names = self.db_manager.get_user_names(msg["user_id"] for msg in conversation["messages"])
+            for msg in conversation["messages"]:
+                msg["name"] = user_names.get(msg["user_id"]) or msg["user_id"]
             
             # Make sure most recent messages are last (as expected by get_context)
             conversation["messages"].reverse()
@@ -122,6 +113,8 @@ class MemoryManager:
         except Exception as e:
             logger.error(f"Error loading conversation for channel {channel_name}: {str(e)}")
         
+        # Short-term memory is bounded, so appends never need trimming
+        conversation["messages"] = deque(conversation["messages"], maxlen=self.short_term_limit)
         return conversation
     
     def _get_messages_from_history_table(self, channel_name: str) -> List[Dict]:
@@ -133,37 +126,12 @@ class MemoryManager:
         Returns:
             List[Dict]: Messages from the history table
         """
-        messages = []
         try:
-            db_path = self.db_manager._get_db_path()
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT user_id, channel_name, content, ts, role 
-                FROM history 
-                WHERE channel_name = ? 
-                ORDER BY ts DESC 
-                LIMIT ?
-            ''', (channel_name, self.short_term_limit))
-            
-            rows = cursor.fetchall()
-            
-            for row in rows:
-                messages.append({
-                    'user_id': row[0],
-                    'channel_name': row[1],
-                    'content': row[2],
-                    'ts': row[3],
-                    'role': row[4]
-                })
-            
-            cursor.close()
-            conn.close()
+            # Read through the database manager's pooled connections instead of opening one per call
+            return self.db_manager.get_recent_history(channel_name, self.short_term_limit)
         except Exception as e:
             logger.error(f"Error querying history table: {str(e)}")
-        
-        return messages
+            return []
     
     def get_context(self, channel: str) -> List[Dict]:
         """Get context combining short and long-term memory"""
@@ -183,8 +151,8 @@ class MemoryManager:
                 "content": self._format_long_term_memory(latest_memory)
             })
         
-        # Add recent messages
-        for msg in conv_memory["messages"]:
+        # Add recent messages from a snapshot; another handler thread may append to the deque meanwhile
+        for msg in list(conv_memory["messages"]):
             context.append({
                 "role": "user" if msg["role"] == "user" else "assistant",
                 "content": msg["content"],
@@ -216,10 +184,7 @@ class MemoryManager:
         """Generate structured memory text from messages"""
         try:
             # Convert messages to a readable format
-            conversation_text = "\n".join([
-                f"{msg['name']}: {msg['content']}" 
-                for msg in messages
-            ])
+            conversation_text = "\n".join(map("{name}: {content}".format_map, messages))
             
             # Generate structured memory using LLM
             response = self.llm_cache.generate_response(
@@ -245,9 +210,9 @@ class MemoryManager:
             
             try:
                 # Parse JSON response
-                memory_dict = json.loads(response)
+                memory_dict = orjson.loads(response)
                 return memory_dict
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error("Failed to parse memory response as JSON")
                 return None
             
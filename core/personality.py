@@ -13,79 +13,80 @@ import random
 
 logger = logging.getLogger(__name__)
 
-def personality_to_behavior(personality_dict: Dict) -> Dict:
-    """Convert personality traits to behavioral instructions"""
-    behavior_map = {
-        "emotional_stability": {
-            "adjustment": {
-                "low": "Display anxious, uncertain behaviors.",
-                "medium": "Remain calm, showing moderate confidence.",
-                "high": "Exhibit poise and resilience, offering reassurance in stressful situations."
-            },
-            "self_esteem": {
-                "low": "Show self-doubt, hesitancy in suggestions.",
-                "medium": "Display a balanced sense of confidence.",
-                "high": "Exude confidence in decisions and promote self-assured actions."
-            }
+# Behavioral descriptions for every level of each trait subcomponent
+BEHAVIOR_MAP = {
+    "emotional_stability": {
+        "adjustment": {
+            "low": "Display anxious, uncertain behaviors.",
+            "medium": "Remain calm, showing moderate confidence.",
+            "high": "Exhibit poise and resilience, offering reassurance in stressful situations."
         },
-        "extraversion": {
-            "dominance": {
-                "low": "Adopt a reserved, passive role in discussions.",
-                "medium": "Engage actively but not overpoweringly.",
-                "high": "Take charge, offer assertive guidance, and direct team actions."
-            },
-            "affiliation": {
-                "low": "Minimize social interactions, focus on task content.",
-                "medium": "Engage in friendly yet task-oriented dialogue.",
-                "high": "Foster a sociable atmosphere, actively seek and offer support."
-            },
-            "social_perceptiveness": {
-                "low": "Overlook social cues, respond mainly to task demands.",
-                "medium": "Recognize and address basic social signals.",
-                "high": "Keenly attune to others' emotions and needs, enhancing cohesion."
-            },
-            "expressivity": {
-                "low": "Use minimalistic, formal language.",
-                "medium": "Communicate with balanced expressiveness.",
-                "high": "Employ enthusiastic and vivid language to convey ideas effectively."
-            }
+        "self_esteem": {
+            "low": "Show self-doubt, hesitancy in suggestions.",
+            "medium": "Display a balanced sense of confidence.",
+            "high": "Exude confidence in decisions and promote self-assured actions."
+        }
+    },
+    "extraversion": {
+        "dominance": {
+            "low": "Adopt a reserved, passive role in discussions.",
+            "medium": "Engage actively but not overpoweringly.",
+            "high": "Take charge, offer assertive guidance, and direct team actions."
         },
-        "openness": {
-            "flexibility": {
-                "low": "Adhere strictly to established plans.",
-                "medium": "Suggest alternative approaches when appropriate.",
-                "high": "Frequently propose innovative solutions and adapt strategies flexibly."
-            }
+        "affiliation": {
+            "low": "Minimize social interactions, focus on task content.",
+            "medium": "Engage in friendly yet task-oriented dialogue.",
+            "high": "Foster a sociable atmosphere, actively seek and offer support."
         },
-        "agreeableness": {
-            "trust": {
-                "low": "Withhold information, verify others' inputs cautiously.",
-                "medium": "Share information with some selectivity.",
-                "high": "Be open and transparent, fostering a trusting environment."
-            },
-            "cooperation": {
-                "low": "Prioritize individual task efficiency.",
-                "medium": "Collaborate with moderate willingness.",
-                "high": "Actively support others, seek consensus, and prioritize group goals."
-            }
+        "social_perceptiveness": {
+            "low": "Overlook social cues, respond mainly to task demands.",
+            "medium": "Recognize and address basic social signals.",
+            "high": "Keenly attune to others' emotions and needs, enhancing cohesion."
         },
-        "conscientiousness": {
-            "dependability": {
-                "low": "Display inconsistent behavior, overlook details.",
-                "medium": "Provide reliable follow-up and task tracking.",
-                "high": "Ensure meticulous task management and consistency in actions."
-            },
-            "achievement": {
-                "low": "Avoid taking initiative, show limited goal orientation.",
-                "medium": "Set clear objectives, encourage goal pursuit.",
-                "high": "Drive team toward excellence, offering constructive feedback."
-            }
+        "expressivity": {
+            "low": "Use minimalistic, formal language.",
+            "medium": "Communicate with balanced expressiveness.",
+            "high": "Employ enthusiastic and vivid language to convey ideas effectively."
+        }
+    },
+    "openness": {
+        "flexibility": {
+            "low": "Adhere strictly to established plans.",
+            "medium": "Suggest alternative approaches when appropriate.",
+            "high": "Frequently propose innovative solutions and adapt strategies flexibly."
+        }
+    },
+    "agreeableness": {
+        "trust": {
+            "low": "Withhold information, verify others' inputs cautiously.",
+            "medium": "Share information with some selectivity.",
+            "high": "Be open and transparent, fostering a trusting environment."
+        },
+        "cooperation": {
+            "low": "Prioritize individual task efficiency.",
+            "medium": "Collaborate with moderate willingness.",
+            "high": "Actively support others, seek consensus, and prioritize group goals."
+        }
+    },
+    "conscientiousness": {
+        "dependability": {
+            "low": "Display inconsistent behavior, overlook details.",
+            "medium": "Provide reliable follow-up and task tracking.",
+            "high": "Ensure meticulous task management and consistency in actions."
+        },
+        "achievement": {
+            "low": "Avoid taking initiative, show limited goal orientation.",
+            "medium": "Set clear objectives, encourage goal pursuit.",
+            "high": "Drive team toward excellence, offering constructive feedback."
         }
     }
+}
 
-    # We'll simply return a copy of the full behavior map since the UI
-    # expects the full structure with all levels for each subcomponent
-    return behavior_map
+def personality_to_behavior(personality_dict: Dict) -> Dict:
+    """Convert personality traits to behavioral instructions"""
+    # The UI expects the full structure with all levels for each subcomponent,
+    # which doesn't depend on the traits, so the shared map is returned as-is
+    return BEHAVIOR_MAP
 
 def generate_name_and_summary(personality_dict: Dict, behaviors: Dict) -> Dict:
     """Generate a name and summary using GPT-4"""
@@ -190,7 +191,7 @@ def standardize_traits(traits_dict: Dict) -> Dict:
                         level_category = "medium"  # Default
                     
                     standardized[trait_name][subcomponent] = level_category
-            else:
+                else:
                     # If subcomponent is missing, default to medium
                     standardized[trait_name][subcomponent] = "medium"
         else:
@@ -355,7 +356,7 @@ def dict_to_personality(data: Dict) -> Personality:
         name=data.get("name", "AI Teammate"),
         description=data.get("description", "A helpful and professional AI teammate"),
         traits=traits,
-        communication_style={},
+        communication_style=data.get("communication_style") or "standard",
         response_characteristics={
             "response_length": data.get("response_characteristics", {}).get("response_length", "medium")
         }
@@ -436,6 +437,11 @@ def Personality_to_dict(self) -> Dict:
     """Instance method to convert Personality to a dictionary"""
     return personality_to_dict(self)
 
+def Personality_from_dict(cls, data: Dict) -> 'Personality':
+    """Class method to create a Personality from a stored dictionary"""
+    return dict_to_personality(data)
+
 # Add the methods to the Personality class
 Personality.from_ui_data = classmethod(Personality_from_ui_data)
-Personality.to_dict = Personality_to_dict
\ No newline at end of file
+Personality.to_dict = Personality_to_dict
+Personality.from_dict = classmethod(Personality_from_dict)
\ No newline at end of file
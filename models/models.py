@@ -1,6 +1,10 @@
 from dataclasses import dataclass, field
-from typing import Optional, Dict, List
+from typing import Any, Deque, Optional, Dict, List, Set
 from datetime import datetime
+from collections import deque
+
+# Most recent messages kept in memory per room; older ones remain in the database
+ROOM_HISTORY_LIMIT = 500
 
 @dataclass
 class Message:
@@ -15,6 +19,15 @@ class Message:
     files: Optional[List[Dict]] = None
     type: str = "memory"
 
+@dataclass(slots=True)
+class Room:
+    """State of an active chat room"""
+    name: str
+    pipeline: Any  # WebPipeline serving the room
+    participants: Set[str] = field(default_factory=set)
+    messages: Deque[Dict] = field(default_factory=lambda: deque(maxlen=ROOM_HISTORY_LIMIT))  # Message history: [{'user': str, 'text': str}]
+    ai_enabled: bool = True  # Flag to enable/disable AI teammate
+
 @dataclass
 class FileMetadata:
     file_id: str
@@ -1,7 +1,5 @@
 from dataclasses import dataclass
 from typing import Dict, Optional
-import os
-from pathlib import Path
 
 @dataclass
 class WebBotConfig:
@@ -17,10 +15,3 @@ class WebBotConfig:
             openai_model=env_dict.get('OPEN_AI_MODEL', 'gpt-4'),
             sqlite_db_name=env_dict.get('SQLITE_DB_NAME', 'chat_history.db')
         )
-
-    def __post_init__(self):
-        # Create data directory if it doesn't exist
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-            
-        return self 
\ No newline at end of file
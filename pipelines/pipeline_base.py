@@ -17,7 +17,7 @@ class BasePipeline(ABC):
         
         # Initialize managers
         self.db_manager = DatabaseManager(config)
-        self.memory_manager = MemoryManager(config)
+        self.memory_manager = MemoryManager(config, db_manager=self.db_manager)
     
     @abstractmethod
     def _create_message(self, message_data: Dict) -> Message:
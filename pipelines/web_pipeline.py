@@ -10,24 +10,26 @@ from core.response_generator import ResponseGenerator
 from core.database_manager import DatabaseManager
 from core.memory_manager import MemoryManager
 from sample_info.tasks import desert_survival_task
-import socket  # Add this import at the top
 
 logger = logging.getLogger(__name__)
 
 class WebPipeline(BasePipeline):
-    def __init__(self, config: WebBotConfig, room_name: str = None, task: str = None):
+    def __init__(self, config: WebBotConfig, room_name: str = None, task: str = None,
+                 db_manager: Optional[DatabaseManager] = None):
         """Initialize the web pipeline with config and optional room name and task
         
         Args:
             config (WebBotConfig): Configuration for the web bot
             room_name (str, optional): Name of the chat room. Defaults to None.
             task (str, optional): Task description for the team. Defaults to desert_survival_task.
+            db_manager (DatabaseManager, optional): Shared database manager. A new one is
+                created when not provided.
         """
         self.config = config
         self.room_name = room_name
         
-        # Initialize database manager
-        self.db_manager = DatabaseManager(config)
+        # Reuse the shared database manager when one is provided
+        self.db_manager = db_manager or DatabaseManager(config)
         
         # Try to load saved task for this room, or use provided/default task
         if room_name:
@@ -55,15 +57,10 @@ class WebPipeline(BasePipeline):
             self.personality = generate_random_persona()
         
         # Initialize other components
-        self.memory_manager = MemoryManager(self.db_manager)
+        self.memory_manager = MemoryManager(config, db_manager=self.db_manager)
         self.action_manager = ActionManager(config, self.personality)
         self.response_generator = ResponseGenerator(config, self.personality, self.task)
         
-        # Print local network IP address
-        local_ip = self._get_local_ip()
-        logger.info(f"App accessible on local network at: {local_ip}")
-        print(f"App accessible on local network at: {local_ip}")
-        
     def _create_message(self, message_data: Dict) -> Message:
         """Create a Message object from web message data"""
         return Message(
@@ -114,8 +111,9 @@ class WebPipeline(BasePipeline):
             
             # Log context details
             logger.info(f"Context length: {len(context)} messages")
-            for i, ctx_msg in enumerate(context):
-                logger.info(f"Context message {i}: role={ctx_msg.get('role')}, content={ctx_msg.get('content')[:30]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                for i, ctx_msg in enumerate(context):
+                    logger.debug("Context message %d: role=%s, content=%s...", i, ctx_msg.get('role'), ctx_msg.get('content')[:30])
             
             # Step 5: Decide whether to respond
             logger.info("Step 5: Deciding whether to respond")
@@ -172,15 +170,3 @@ class WebPipeline(BasePipeline):
             
         except Exception as e:
             logger.error(f"Error saving response: {str(e)}", exc_info=True)
-
-    def _get_local_ip(self):
-        """Get the local network IP address of the machine."""
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except Exception as e:
-            logger.error(f"Error obtaining local IP: {str(e)}", exc_info=True)
-            return "Unable to determine local IP" 
\ No newline at end of file
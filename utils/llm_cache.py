@@ -28,6 +28,23 @@ class LLMCache:
             model="gpt-4",
             temperature=0.7
         )
+        
+        # Chat models keyed by (temperature, max_tokens), reused across calls
+        self._chat_models = {(0.7, None): self.chat}
+    
+    def _get_chat_model(self, temperature: float, max_tokens: Optional[int]) -> ChatOpenAI:
+        """Get a chat model for the given parameters, creating it on first use"""
+        key = (temperature, max_tokens)
+        chat = self._chat_models.get(key)
+        if chat is None:
+            chat_kwargs = {
+                "model": "gpt-4",
+                "temperature": temperature
+            }
+            if max_tokens:
+                chat_kwargs["max_tokens"] = max_tokens
+            chat = self._chat_models[key] = ChatOpenAI(**chat_kwargs)
+        return chat
     
     def _get_cache_key(self, messages: List[Dict]) -> str:
         """Generate a cache key from messages"""
@@ -81,17 +98,10 @@ class LLMCache:
                 with open(cache_file, 'r') as f:
                     return json.load(f)['response']
             
-            # Create chat model with specified parameters
-            chat_kwargs = {
-                "model": "gpt-4",
-                "temperature": temperature
-            }
-            if max_tokens:
-                chat_kwargs["max_tokens"] = max_tokens
-            chat = ChatOpenAI(**chat_kwargs)
+            # Get chat model with specified parameters
+            chat = self._get_chat_model(temperature, max_tokens)
             
             # Convert messages to LangChain message format
-            from langchain.schema import HumanMessage, SystemMessage, AIMessage
             langchain_message_objects = []
             for msg in messages:
                 role = msg.get("role", "user")
@@ -1,5 +1,5 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from models.models import Message
+from models.models import Message, Room
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from pipelines.web_pipeline import WebPipeline
 from models.web_config import WebBotConfig
@@ -19,6 +19,10 @@ import json
 import time
 import uuid
 import socket
+import threading
+import queue
+import atexit
+from functools import lru_cache
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -30,20 +34,33 @@ app.secret_key = os.urandom(24)
 app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600
-socketio = SocketIO(app, cors_allowed_origins="*", always_connect=True)
+# API payloads are built server-side in a fixed order, so skip per-response key sorting
+app.json.sort_keys = False
+# Templates ship with the app; don't stat them for changes on every render
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+# Single origin policy shared by Socket.IO and the HTTP CORS headers
+CORS_ALLOWED_ORIGINS = '*'
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': CORS_ALLOWED_ORIGINS,
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+    'Access-Control-Allow-Methods': 'GET,PUT,POST,DELETE,OPTIONS'
+}
+
+socketio = SocketIO(app, cors_allowed_origins=CORS_ALLOWED_ORIGINS, always_connect=True)
 
 # Add these headers to all responses
 @app.after_request
 def after_request(response):
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.update(CORS_HEADERS)
     return response
 
 # Store active rooms and users
-active_rooms = {}  # {room_id: {'name': str, 'pipeline': WebPipeline, 'participants': set(), 'messages': list}}
+active_rooms = {}  # {room_id: Room}
 active_users = {}  # {user_id: {'name': str, 'room_id': str}}
 
+# API role for the non-user senders shown in room history
+SENDER_ROLES = {'AI Teammate': 'assistant', 'System': 'system'}
+
 # Ensure required directories exist
 current_dir = Path(__file__).parent
 config_dir = current_dir / 'config'
@@ -97,37 +114,104 @@ env_path = current_dir / '.env'
 load_dotenv(dotenv_path=env_path)
 logger.info(f"Loading .env from: {env_path}")
 
+# Shared database manager, built once and reused by every room's pipeline
+_db_manager = None
+_db_manager_lock = threading.Lock()
+
+# History older than this is moved to the archive tables, checked once a day
+HISTORY_RETENTION_DAYS = 30
+HISTORY_ARCHIVE_INTERVAL = 24 * 60 * 60
+
+def schedule_history_archive(db_manager):
+    """Archive old history now and again every HISTORY_ARCHIVE_INTERVAL seconds"""
+    try:
+        db_manager.archive_history(time.time() - HISTORY_RETENTION_DAYS * 24 * 60 * 60)
+    except Exception as e:
+        logger.error(f"Error archiving history: {str(e)}")
+    timer = threading.Timer(HISTORY_ARCHIVE_INTERVAL, schedule_history_archive, args=(db_manager,))
+    timer.daemon = True
+    timer.start()
+
+def get_db_manager(config):
+    """Return the process-wide DatabaseManager, creating it on first use"""
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            # Re-check under the lock so concurrent first requests build it only once
+            if _db_manager is None:
+                _db_manager = DatabaseManager(config)
+                # Flush queued persona writes before the process exits; atexit runs hooks
+                # last-in first-out, so this runs before the manager's exit finalizer (weakref
+                # registers its hook when the manager is built)
+                atexit.register(_persist_q.join)
+                # First archive pass runs in the background so it doesn't delay this request
+                threading.Thread(target=schedule_history_archive, args=(_db_manager,), daemon=True).start()
+    return _db_manager
+
+# Personas are written by a single background thread so socket handlers don't wait on disk
+_persist_q = queue.Queue()
+
+def _persona_writer():
+    """Drain the persona queue, saving each personality to the database"""
+    while True:
+        db_manager, room_id, personality = _persist_q.get()
+        try:
+            db_manager.save_persona(room_id, personality)
+        except Exception as e:
+            logger.error(f"Error saving persona for room {room_id}: {str(e)}")
+        finally:
+            _persist_q.task_done()
+
+threading.Thread(target=_persona_writer, name='persona-writer', daemon=True).start()
+
+def save_persona_async(db_manager, room_id, personality):
+    """Queue a personality to be saved without blocking the caller"""
+    _persist_q.put((db_manager, room_id, personality))
+
+@lru_cache(maxsize=1)
+def get_bot_config():
+    """Build the bot config from the environment once and reuse it for every room"""
+    return WebBotConfig.from_env(os.environ)
+
 def create_pipeline():
     """Create a new pipeline instance"""
     try:
-        config = WebBotConfig.from_env(os.environ)
+        config = get_bot_config()
         if not config.openai_api_key:
             raise ValueError("OpenAI API key is not set")
         
         # Create pipeline without room name initially
-        pipeline = WebPipeline(config)
+        pipeline = WebPipeline(config, db_manager=get_db_manager(config))
         logger.info("Successfully initialized pipeline")
         return pipeline
     except Exception as e:
         logger.error(f"Error initializing pipeline: {str(e)}")
         return None
 
-def create_room_dict(room_name, pipeline, ai_enabled=True):
-    """Create a new room dictionary with all required fields"""
+def new_room(room_name, pipeline, ai_enabled=True):
+    """Create a new room with all required fields"""
     # Update pipeline with room name
     pipeline.room_name = room_name
     
     # Save initial personality to database
     if pipeline and pipeline.db_manager:
-        pipeline.db_manager.save_persona(room_name, pipeline.personality)
-    
-    return {
-        'name': room_name,
-        'pipeline': pipeline,
-        'participants': set(),
-        'messages': [],  # Store message history: [{'user': str, 'text': str}]
-        'ai_enabled': ai_enabled  # Flag to enable/disable AI teammate
-    }
+        save_persona_async(pipeline.db_manager, room_name, pipeline.personality)
+    
+    return Room(name=room_name, pipeline=pipeline, ai_enabled=ai_enabled)
+
+def get_participant_names(room_id, room):
+    """Return the display names of a room's participants, dropping users that are no longer in it"""
+    participants = room.participants
+    names = []
+    stale = []
+    for uid in participants:
+        user_info = active_users.get(uid)
+        if user_info and user_info['room_id'] == room_id:
+            names.append(user_info['name'])
+        else:
+            stale.append(uid)
+    participants.difference_update(stale)
+    return names
 
 @app.route('/')
 def index():
@@ -143,13 +227,13 @@ def create_room():
         return redirect(url_for('index'))
     
     # Create new room
-    room_id = str(uuid.uuid4())
+    room_id = uuid.uuid4().hex
     pipeline = create_pipeline()
     
     if not pipeline:
         return "Failed to create room: AI assistant not properly configured", 500
     
-    active_rooms[room_id] = create_room_dict(room_name, pipeline, ai_enabled=ai_enabled)
+    active_rooms[room_id] = new_room(room_name, pipeline, ai_enabled=ai_enabled)
     room = active_rooms[room_id]
     
     # Create user and add to room
@@ -166,10 +250,10 @@ def create_room():
         'name': user_name,
         'room_id': room_id
     }
-    room['participants'].add(user_id)
+    room.participants.add(user_id)
     
     # Add system message about room creation
-    room['messages'].append({
+    room.messages.append({
         'user': 'System',
         'text': f"Room '{room_name}' created"
     })
@@ -197,23 +281,17 @@ def join():
         
         # Save user to database
         room = active_rooms[room_id]
-        if room['pipeline'] and room['pipeline'].db_manager:
-            room['pipeline'].db_manager.save_user(user_id, user_name, time.time(), room_id)
+        if room.pipeline and room.pipeline.db_manager:
+            room.pipeline.db_manager.save_user(user_id, user_name, time.time(), room_id)
         
         active_users[user_id] = {
             'name': user_name,
             'room_id': room_id
         }
-        room['participants'].add(user_id)
+        room.participants.add(user_id)
         
         # Broadcast participant update to all users in the room
-        participant_names = []
-        for uid in room['participants']:
-            if uid in active_users:
-                participant_names.append(active_users[uid]['name'])
-            else:
-                # Handle missing users by removing them from participants
-                room['participants'].remove(uid)
+        participant_names = get_participant_names(room_id, room)
         
         socketio.emit('update_participants', {
             'participants': participant_names
@@ -231,46 +309,33 @@ def chat():
         return redirect(url_for('index'))
     
     room = active_rooms[room_id]
-    personality = room['pipeline'].personality
-    task = room['pipeline'].task
+    personality = room.pipeline.personality
+    task = room.pipeline.task
     
     # Get behavior map for the personality using personality_to_behavior
     behavior_map = personality_to_behavior(personality.traits)
     
     # Ensure user is in the room's participants
     user_id = session['user_id']
-    if user_id not in room['participants']:
-        room['participants'].add(user_id)
-    
-    # Get current participants' names
-    participant_names = []
-    for uid in room['participants']:
-        if uid in active_users:
-            participant_names.append(active_users[uid]['name'])
-        else:
-            # Handle missing users by removing them from participants
-            room['participants'].remove(uid)
+    if user_id not in room.participants:
+        room.participants.add(user_id)
     
-    # Clean up any disconnected participants
-    connected_participants = set()
-    for uid in room['participants']:
-        if uid in active_users and active_users[uid]['room_id'] == room_id:
-            connected_participants.add(uid)
-    room['participants'] = connected_participants
+    # Get current participants' names, cleaning up any disconnected participants
+    participant_names = get_participant_names(room_id, room)
     
     # Generate share URL
     share_url = request.url_root + 'join/' + room_id
     
     return render_template('chat.html', 
                          username=session['name'],
-                         room_name=room['name'],
+                         room_name=room.name,
                          room_id=room_id,
                          personality=personality,
                          task=task,
                          participants=participant_names,
                          share_url=share_url,
                          behavior_map=behavior_map,
-                         ai_enabled=room.get('ai_enabled', True))
+                         ai_enabled=room.ai_enabled)
 
 @socketio.on('connect')
 def handle_connect():
@@ -306,11 +371,13 @@ def handle_connect():
     
     join_room(room_id)
     
-    # Send chat history to the new user
-    for message in room['messages']:
+    # Send chat history to the new user in a single event; iterate a snapshot since
+    # other handler threads may append to the deque meanwhile
+    emit('history', [
+        message for message in list(room.messages)
         # Only send valid messages
-        if 'user' in message and message['user'] and 'text' in message and message['text']:
-            emit('message', message)
+        if message.get('user') and message.get('text')
+    ])
             
     # Notify others that user has joined
     join_message = {
@@ -318,13 +385,10 @@ def handle_connect():
         'text': f"{user_info['name']} has joined the chat."
     }
     emit('message', join_message, room=room_id, include_self=False)
-    room['messages'].append(join_message)
+    room.messages.append(join_message)
     
     # Send current participants list
-    participant_names = []
-    for uid in room['participants']:
-        if uid in active_users:
-            participant_names.append(active_users[uid]['name'])
+    participant_names = get_participant_names(room_id, room)
     
     emit('update_participants', {
         'participants': participant_names
@@ -341,10 +405,10 @@ def handle_disconnect():
             room = active_rooms.get(room_id)
             
             if room:
-                room['participants'].discard(user_id)
+                room.participants.discard(user_id)
                 
                 # Remove room if empty
-                if not room['participants']:
+                if not room.participants:
                     active_rooms.pop(room_id, None)
                 else:
                     # Notify others that user has left
@@ -353,13 +417,10 @@ def handle_disconnect():
                         'text': f"{user_info['name']} has left the chat."
                     }
                     emit('message', leave_message, room=room_id)
-                    room['messages'].append(leave_message)
+                    room.messages.append(leave_message)
                     
                     # Update participants list for remaining users
-                    participant_names = []
-                    for uid in room['participants']:
-                        if uid in active_users:
-                            participant_names.append(active_users[uid]['name'])
+                    participant_names = get_participant_names(room_id, room)
                     
                     emit('update_participants', {
                         'participants': participant_names
@@ -409,8 +470,8 @@ def handle_message(data):
         )
         
         # Save message to database using the room's pipeline db_manager
-        if room['pipeline'] and room['pipeline'].db_manager:
-            room['pipeline'].db_manager.save_message(message)
+        if room.pipeline and room.pipeline.db_manager:
+            room.pipeline.db_manager.save_message(message)
         
         # Broadcast the message to the room
         emit_msg = {
@@ -420,7 +481,7 @@ def handle_message(data):
         emit('message', emit_msg, room=room_id)
         
         # Store message in room history
-        room['messages'].append(emit_msg)
+        room.messages.append(emit_msg)
         
         # Create user profile dict for the pipeline
         user_profile_dict = {
@@ -431,8 +492,8 @@ def handle_message(data):
         
         # Check if AI is enabled for this room before processing
         # Use the pipeline to process the message with the user profile
-        if room['pipeline'] and room.get('ai_enabled', True):  # Default to True for backward compatibility
-            response = room['pipeline'].process_message(message, user_profile_dict)
+        if room.pipeline and room.ai_enabled:
+            response = room.pipeline.process_message(message, user_profile_dict)
             
             # If there's a response, broadcast it to the room
             if response:
@@ -441,7 +502,7 @@ def handle_message(data):
                     'text': response
                 }
                 emit('message', bot_msg, room=room_id)
-                room['messages'].append(bot_msg)
+                room.messages.append(bot_msg)
             
     except Exception as e:
         logger.exception(f"Error handling message: {e}")
@@ -460,7 +521,7 @@ def handle_personality_update(data):
     
     try:
         # Update personality traits
-        personality = room['pipeline'].personality
+        personality = room.pipeline.personality
         traits_updated = False
         
         # Check if traits were provided and update them
@@ -477,11 +538,9 @@ def handle_personality_update(data):
         
         # If traits were updated, regenerate name and description
         if traits_updated:
-            # Get behavior map
-            behavior_map = personality_to_behavior(personality.traits)
-            
             try:
                 # Generate new name and description based on the traits
+                behavior_map = personality_to_behavior(personality.traits)
                 name_desc = generate_name_and_summary(personality.traits, behavior_map)
                 personality.name = name_desc.get("name", personality.name)
                 personality.description = name_desc.get("summary", personality.description)
@@ -511,20 +570,19 @@ def handle_personality_update(data):
         if 'communication_style' in data:
             personality.communication_style = data['communication_style']
         
-        # Save updated personality to database
-        if room['pipeline'].db_manager:
-            room['pipeline'].db_manager.save_persona(room_id, personality)
+        # Rebuild the decision prompt from the updated personality
+        room.pipeline.action_manager.set_personality(personality)
         
-        # Get updated behavior map for response
-        behavior_map = personality_to_behavior(personality.traits)
+        # Save updated personality to database
+        if room.pipeline.db_manager:
+            save_persona_async(room.pipeline.db_manager, room_id, personality)
         
         # Notify all users in the room about the personality update
         response_data = {
             'name': personality.name,
             'description': personality.description,
             'traits': personality.traits,
-            'response_characteristics': personality.response_characteristics,
-            'behavior_map': behavior_map
+            'response_characteristics': personality.response_characteristics
         }
         
         logger.info(f"Emitting personality_updated event with name: {personality.name}, description: {personality.description}")
@@ -536,7 +594,7 @@ def handle_personality_update(data):
             'text': f"{session['name']} has updated the team interaction settings."
         }
         emit('message', update_message, room=room_id)
-        room['messages'].append(update_message)
+        room.messages.append(update_message)
         
     except Exception as e:
         logger.error(f"Error updating personality: {str(e)}")
@@ -558,10 +616,10 @@ def join_room_link(room_id):
         return redirect(url_for('index'))
     
     room = active_rooms[room_id]
-    logger.info(f"Found room: {room['name']}")
+    logger.info(f"Found room: {room.name}")
     
     return render_template('join.html', 
-                         room_name=room['name'],
+                         room_name=room.name,
                          room_id=room_id)
 
 @app.route('/join_room', methods=['POST'])
@@ -586,14 +644,14 @@ def join_room_post():
     
     # Save user to database
     room = active_rooms[room_id]
-    if room['pipeline'] and room['pipeline'].db_manager:
-        room['pipeline'].db_manager.save_user(user_id, username, time.time(), room_id)
+    if room.pipeline and room.pipeline.db_manager:
+        room.pipeline.db_manager.save_user(user_id, username, time.time(), room_id)
     
     active_users[user_id] = {
         'name': username,
         'room_id': room_id
     }
-    room['participants'].add(user_id)
+    room.participants.add(user_id)
     
     return redirect(url_for('chat'))
 
@@ -607,9 +665,9 @@ def get_room_messages(room_id):
     
     # Get messages from database first if available
     db_messages = []
-    if room['pipeline'] and room['pipeline'].db_manager:
+    if room.pipeline and room.pipeline.db_manager:
         # Query database for messages with this room_id
-        db_messages = room['pipeline'].db_manager.get_history({
+        db_messages = room.pipeline.db_manager.get_history({
             'room_id': room_id,
             'limit': 100  # Limit to latest 100 messages
         })
@@ -617,18 +675,14 @@ def get_room_messages(room_id):
     # If we have database messages, use those
     if db_messages:
         valid_messages = []
+        # Resolve every sender's name in one query
+        user_names = room.pipeline.db_manager.get_user_names(msg['user_id'] for msg in db_messages)
         for msg in db_messages:
-            # Get user name from user_id if possible
-            user_name = "Unknown User"
-            if room['pipeline'] and room['pipeline'].db_manager:
-                db_user_name = room['pipeline'].db_manager.get_user_name(msg['user_id'])
-                if db_user_name:
-                    user_name = db_user_name
-            elif msg['user_id'] in active_users:
-                user_name = active_users[msg['user_id']]['name']
+            user_id = msg['user_id']
+            user_name = user_names.get(user_id) or "Unknown User"
             
             # Special names for system and AI
-            if msg['user_id'] == 'system':
+            if user_id == 'system':
                 user_name = 'System'
             elif msg.get('role') == 'assistant':
                 user_name = 'AI Teammate'
@@ -643,14 +697,14 @@ def get_room_messages(room_id):
     
     # Fallback to in-memory messages if no database results
     valid_messages = []
-    for msg in room['messages']:
+    # Snapshot the deque; handler threads may append to it while we iterate
+    for msg in list(room.messages):
         if 'user' in msg and msg['user'] and 'text' in msg and msg['text']:
             # Convert to API format
             valid_messages.append({
                 'user_id': msg['user'],
                 'content': msg['text'],
-                'role': 'user' if msg['user'] != 'AI Teammate' and msg['user'] != 'System' else 
-                       ('assistant' if msg['user'] == 'AI Teammate' else 'system')
+                'role': SENDER_ROLES.get(msg['user'], 'user')
             })
     
     return jsonify(valid_messages)
@@ -674,7 +728,6 @@ def get_all_local_ips():
         preferred_ip = get_local_ip()
         
         # Also get all available IPs
-        import socket
         hostname = socket.gethostname()
         all_ips = socket.gethostbyname_ex(hostname)[2]
         
@@ -693,6 +746,9 @@ def get_all_local_ips():
 
 if __name__ == '__main__':
     port = 3001  # Use port 3000 which is less likely to be in use
+    
+    # Compile the chat page up front so the first room render doesn't pay for it
+    app.jinja_env.get_template('chat.html')
     all_ips = get_all_local_ips()
 
     # Detect if running in Docker